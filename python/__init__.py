@@ -5,7 +5,7 @@ Real-time anxiety detection for C/C++ programmers
 
 from .feature_extractor import FeatureExtractor, datetime_parser
 from .model_loader import ModelLoader
-from .anxiety_detector import AnxietyDetector, PipeServer
+from .anxiety_detector import AnxietyDetector, AnalyzeResult, PipeServer
 
 __version__ = '1.0.0'
-__all__ = ['FeatureExtractor', 'ModelLoader', 'AnxietyDetector', 'PipeServer']
\ No newline at end of file
+__all__ = ['FeatureExtractor', 'ModelLoader', 'AnxietyDetector', 'AnalyzeResult', 'PipeServer']
\ No newline at end of file
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+"""
+Ahead-of-time compilation of the numba kernels
+Builds the anxiety_kernels extension module next to this file so the
+service starts without paying JIT compilation on the first request
+"""
+
+import os
+from numba.pycc import CC
+
+import kernels
+
+cc = CC('anxiety_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+cc.export('trigger_mask', 'u1(f8[:], f8[:])')(kernels.trigger_mask)
+cc.export('typing_kernel', 'Tuple((i8, f8, f8, f8, f8))(i8[:])')(kernels.typing_kernel)
+
+if __name__ == "__main__":
+    cc.compile()
@@ -8,17 +8,255 @@ import sys
 import json
 import os
 import time
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import struct
 import threading
-from datetime import datetime
+import functools
+import queue
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+import msgpack
+import numpy as np
 import win32pipe
 import win32file
+import win32event
+import winerror
 import pywintypes
 import win32security
 import win32con
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernels run interpreted without it
+    njit = None
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib json codec is used without it
+    orjson = None
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional; hints fall back to a linear scan
+    ahocorasick = None
+
 from feature_extractor import FeatureExtractor, datetime_parser
 from model_loader import ModelLoader
 
+log = logging.getLogger('anxiety')
+
+def _start_logging(level=logging.INFO) -> QueueListener:
+    """Send log records through a queue so console I/O stays off request threads"""
+    log_queue = queue.SimpleQueue()
+    log.addHandler(QueueHandler(log_queue))
+    log.setLevel(level)
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    listener.start()
+    return listener
+
+# Wire format: msgpack requests are framed as a 4-byte big-endian length
+# followed by the payload. Legacy clients (the C++ bridge) send bare JSON
+# objects, which are recognised by their leading '{' (after any whitespace or
+# UTF-8 BOM; no frame under _MAX_FRAME starts with one of those bytes).
+_FRAME_HEADER = struct.Struct('>I')
+_MAX_FRAME = 16 * 1024 * 1024
+_JSON_LEAD = b' \t\r\n\xef\xbb\xbf'
+_UTF8_BOM = b'\xef\xbb\xbf'
+_EXT_DATETIME = 1
+_EPOCH = datetime(1970, 1, 1)
+_I64 = struct.Struct('>q')
+ERROR_MORE_DATA = winerror.ERROR_MORE_DATA
+_ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+                   if orjson is not None else 0)
+
+def _msgpack_default(obj):
+    """Encode values msgpack does not handle natively"""
+    if isinstance(obj, datetime):
+        # Naive datetimes as microseconds since the epoch (aware ones are
+        # packed as msgpack Timestamps by packb itself)
+        micros = (obj - _EPOCH) // timedelta(microseconds=1)
+        return msgpack.ExtType(_EXT_DATETIME, _I64.pack(micros))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def _msgpack_ext_hook(code, data):
+    """Decode extension types produced by _msgpack_default"""
+    if code == _EXT_DATETIME:
+        return _EPOCH + timedelta(microseconds=_I64.unpack(data)[0])
+    return msgpack.ExtType(code, data)
+
+# Features checked by get_triggered_features, their defaults when missing,
+# the research thresholds and the label reported for each set bit
+FEATURE_KEYS = ('RED_METRIC', 'TYPING_SPEED', 'BACKSPACE_RATE',
+                'KEYSTROKE_RATE', 'COMPILE_ERROR', 'FOCUS_SWITCHES')
+_FEATURE_DEFAULTS = (0.0, 1.0, 0.0, 0.0, 0.0, 0.0)
+THRESHOLDS = np.array([
+    2.5,   # RED_METRIC
+    0.65,  # TYPING_SPEED: 35% drop from baseline
+    0.3,   # BACKSPACE_RATE
+    0.5,   # KEYSTROKE_RATE
+    0.5,   # COMPILE_ERROR
+    5.0    # FOCUS_SWITCHES
+])
+_TRIGGER_LABELS = ('Repeated Errors', 'Slow Typing', 'Excessive Corrections',
+                   'Irregular Rhythm', 'Frequent Compilation Errors',
+                   'Frequent Context Switching')
+
+try:
+    # Compiled ahead of time by _build_aot.py at install
+    from anxiety_kernels import trigger_mask as _trigger_mask
+except ImportError:
+    from kernels import trigger_mask as _trigger_mask
+    if njit is not None:
+        _trigger_mask = njit(cache=True, boundscheck=False)(_trigger_mask)
+
+# Anxiety levels that warrant an intervention
+_INTERVENTION_LEVELS = frozenset(('High', 'Extreme'))
+
+# Error hints, in priority order
+_HINTS = MappingProxyType({
+    'syntax_error': "Check for missing semicolons, brackets, or parentheses",
+    'missing_semicolon': "You might be missing a semicolon at the end of a statement",
+    'undefined_reference': "You might be missing a header file or library link",
+    'missing_header': "Check if you've included the necessary header files",
+    'segmentation_fault': "Check for null pointers or array bounds",
+    'null_pointer': "Make sure to initialize pointers before using them",
+    'array_bounds': "Ensure array indices are within bounds",
+    'uninitialized': "Initialize variables before using them",
+    'memory_leak': "Remember to free allocated memory",
+    'buffer_overflow': "Check array sizes and string lengths",
+    'type_mismatch': "Ensure types are compatible",
+    'no_matching_function': "Check function parameters and overloads",
+    'ambiguous': "Make the call more specific",
+    'redefinition': "Remove duplicate declarations",
+    'undeclared': "Declare variables before using them",
+    'incomplete_type': "Include the full type definition"
+})
+_HINT_DEFAULT = "Take a deep breath. Try breaking down the problem into smaller parts."
+
+# Session fields holding ISO datetimes
+_TOP_DT_KEYS = ('session_start', 'last_activity')
+
+# (event list, array key) pairs: each list's timestamps become an int64 epoch
+# nanosecond array under the array key
+_EVENT_TS_NS_KEYS = (('keystrokes', 'keystroke_timestamps_ns'), ('compiles', 'compile_timestamps_ns'))
+
+class AnalyzeResult(NamedTuple):
+    """
+    Result of AnxietyDetector.analyze_session
+    
+    msgpack clients receive the fields positionally as an array in this
+    order; JSON clients receive an object keyed by field name.
+    """
+    level: str
+    confidence: float
+    probabilities: Optional[dict]  # only for verbose requests
+    features: Optional[dict]  # only for verbose requests
+    triggered_features: list
+    timestamp_us: int
+    should_intervene: bool
+
+def _triggered_labels(values):
+    """Labels of the FEATURE_KEYS values that cross their thresholds"""
+    mask = _trigger_mask(values, THRESHOLDS)
+    triggered = [label for bit, label in enumerate(_TRIGGER_LABELS) if mask & (1 << bit)]
+    
+    return triggered if triggered else ['Normal Pattern']
+
+class _AdaptiveBatcher:
+    """Runs queued predictions through the model as one batch"""
+    
+    def __init__(self, model_loader: ModelLoader, max_batch: int = 32, max_latency_ms: float = 10):
+        """
+        Start the batching worker
+        
+        Args:
+            model_loader: Loaded model used for batch predictions
+            max_batch: Maximum number of samples per model call
+            max_latency_ms: Longest a queued request waits for stragglers
+        """
+        self.model_loader = model_loader
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()  # orders submit against close
+        self._worker = threading.Thread(target=self._run, name='predict-batcher', daemon=True)
+        self._worker.start()
+    
+    def submit(self, vector: np.ndarray) -> Future:
+        """Queue a feature vector; the future resolves to (class, confidence, probabilities)"""
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError('batcher closed')
+            self._queue.put((vector, future))
+        return future
+    
+    def close(self):
+        """Stop the worker once the queue is drained"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+    
+    def _run(self):
+        batch = []
+        try:
+            closing = False
+            while not closing:
+                item = self._queue.get()
+                if item is None:
+                    break
+                
+                batch = [item]
+                deadline = time.monotonic() + self.max_latency
+                while len(batch) < self.max_batch:
+                    # Only linger for stragglers when requests are already queueing up
+                    timeout = deadline - time.monotonic() if len(batch) > 1 else 0
+                    try:
+                        item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        closing = True
+                        break
+                    batch.append(item)
+                
+                self._predict(batch)
+        finally:
+            # Whether closed or stopped by an error, refuse new work and never
+            # leave a queued caller waiting
+            with self._close_lock:
+                self._closed = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    batch.append(item)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError('batcher closed'))
+    
+    def _predict(self, batch):
+        vectors, futures = zip(*batch)
+        try:
+            features = np.vstack(vectors)
+            classes, confidences, probabilities = self.model_loader.predict_batch(features)
+            results = [(classes[i], float(confidences[i]), probabilities[i]) for i in range(len(futures))]
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
 class AnxietyDetector:
     """Main anxiety detection class"""
     
@@ -37,264 +275,506 @@ class AnxietyDetector:
         if not self.model_loader.load_models():
             raise RuntimeError("Failed to load models")
         
+        # Features are extracted into a per-thread buffer in extractor order;
+        # index arrays pick out the trigger features and the model's order
+        self._feat_names = tuple(self.feature_extractor.get_feature_names())
+        self._trigger_index = np.array([self._feat_names.index(k) for k in FEATURE_KEYS])
+        model_order = self.model_loader.feature_names
+        if model_order and tuple(model_order) != self._feat_names:
+            # Model features the extractor does not produce read the zero
+            # slot kept past the end of the buffer
+            zero_slot = len(self._feat_names)
+            for name in model_order:
+                if name not in self._feat_names:
+                    log.warning("Model feature %s is not extracted; using 0", name)
+            self._model_index = np.array([self._feat_names.index(n) if n in self._feat_names else zero_slot
+                                          for n in model_order])
+        else:
+            self._model_index = None
+        self._local = threading.local()
+        
+        # Batch concurrent predictions into single model calls
+        self.batcher = _AdaptiveBatcher(self.model_loader)
+        
         # Session tracking
         self.current_session = {}
-        self.last_intervention = None
+        self.last_intervention_mono = None  # time.monotonic() of last intervention
         self.intervention_cooldown = 300  # 5 minutes
         
+        # Guards feature extractor and intervention state across client threads
+        self._lock = threading.Lock()
+        
         # Get feature importance for explanation
         self.feature_importance = self.model_loader.get_feature_importance()
         
+        # Compile the trigger kernel now rather than on the first request
+        _trigger_mask(np.zeros(len(FEATURE_KEYS)), THRESHOLDS)
+        
+        # Match all hint keys in a single pass over the error text
+        self._hint_automaton = None
+        if ahocorasick is not None:
+            self._hint_automaton = ahocorasick.Automaton()
+            for priority, (key, hint) in enumerate(_HINTS.items()):
+                self._hint_automaton.add_word(key, (priority, hint))
+            self._hint_automaton.make_automaton()
+        
+        # Error strings repeat heavily across a session
+        self._lookup_hint = functools.lru_cache(maxsize=256)(self._match_hint)
+        
         print(f"Anxiety Detector initialized with models from {model_dir}")
         model_info = self.model_loader.get_model_info()
         print(f"Model type: {model_info['model_type']}")
         print(f"Classes: {model_info['classes']}")
     
-    def analyze_session(self, session_data: dict) -> dict:
+    def analyze_session(self, session_data: dict, proto_version: int = 1, verbose: bool = False) -> AnalyzeResult:
         """
         Analyze a programming session
         
         Args:
             session_data: Raw session data from plugin
+            proto_version: Protocol version of the sender. Version 2 senders
+                give each keystroke/compile an integer 'timestamp_us' (epoch
+                microseconds) instead of an ISO 'timestamp' string
+            verbose: Include class probabilities and the feature values
             
         Returns:
             Analysis results with prediction and metrics
         """
-        # Parse datetime strings
-        if 'session_start' in session_data and isinstance(session_data['session_start'], str):
-            session_data['session_start'] = datetime.fromisoformat(session_data['session_start'])
-        if 'last_activity' in session_data and isinstance(session_data['last_activity'], str):
-            session_data['last_activity'] = datetime.fromisoformat(session_data['last_activity'])
-        
-        if 'keystrokes' in session_data:
-            for ks in session_data['keystrokes']:
-                if 'timestamp' in ks and isinstance(ks['timestamp'], str):
-                    ks['timestamp'] = datetime.fromisoformat(ks['timestamp'])
-        
-        if 'compiles' in session_data:
-            for comp in session_data['compiles']:
-                if 'timestamp' in comp and isinstance(comp['timestamp'], str):
-                    comp['timestamp'] = datetime.fromisoformat(comp['timestamp'])
-        
-        # Extract features
-        features = self.feature_extractor.extract_all_features(session_data)
-        
-        # Update baseline
-        self.feature_extractor.update_baseline(features)
+        if proto_version >= 2:
+            # Integer timestamps go straight to the feature extractor
+            for list_key, array_key in _EVENT_TS_NS_KEYS:
+                events = session_data.get(list_key)
+                if events:
+                    session_data[array_key] = np.fromiter((ev['timestamp_us'] for ev in events),
+                                                          dtype=np.int64, count=len(events)) * 1000
+        else:
+            # Parse datetime strings
+            for key in _TOP_DT_KEYS:
+                value = session_data.get(key)
+                if type(value) is str:
+                    session_data[key] = datetime.fromisoformat(value)
+            
+            # Parse event timestamps in one NumPy pass, without creating a
+            # datetime per event
+            for list_key, array_key in _EVENT_TS_NS_KEYS:
+                events = session_data.get(list_key)
+                if events:
+                    session_data[array_key] = np.array([ev['timestamp'] for ev in events],
+                                                       dtype='datetime64[us]').view(np.int64) * 1000
+        
+        buf = self._feature_buffer()
+        values = buf[:-1]  # extractor order; the trailing zero slot is left alone
+        with self._lock:
+            # Extract features
+            self.feature_extractor.extract_all_features(session_data, out=values)
+            
+            # Update baseline
+            self.feature_extractor.update_baseline_from_vector(values)
         
-        # Make prediction
-        predicted_class, confidence, probabilities = self.model_loader.predict_from_dict(features)
+        # Make prediction (outside the lock so concurrent requests can batch)
+        vector = values if self._model_index is None else buf[self._model_index]
+        predicted_class, confidence, probabilities = self.batcher.submit(vector).result()
         
         # Determine triggered features
-        triggered = self.get_triggered_features(features)
+        triggered = _triggered_labels(buf[self._trigger_index])
         
         # Check if intervention is needed
-        should_intervene = self.should_intervene(predicted_class, confidence)
-        
-        return {
-            'level': predicted_class,
-            'confidence': confidence,
-            'probabilities': probabilities,
-            'features': features,
-            'triggered_features': triggered,
-            'timestamp': datetime.now().isoformat(),
-            'should_intervene': should_intervene
-        }
+        with self._lock:
+            should_intervene = self.should_intervene(predicted_class, confidence)
+        
+        if verbose:
+            probabilities = self.model_loader.probabilities_to_dict(probabilities)
+            features = dict(zip(self._feat_names, values.tolist()))
+        else:
+            probabilities = features = None
+        
+        return AnalyzeResult(predicted_class, confidence, probabilities, features,
+                             triggered, time.time_ns() // 1000, should_intervene)
+    
+    def _feature_buffer(self) -> np.ndarray:
+        """Preallocated feature vector for the calling thread, plus a trailing zero slot"""
+        buf = getattr(self._local, 'feat_buf', None)
+        if buf is None:
+            buf = self._local.feat_buf = np.zeros(len(self._feat_names) + 1, dtype=np.float64)
+        return buf
+    
+    def close(self):
+        """Release background resources"""
+        self.batcher.close()
     
     def get_triggered_features(self, features: dict) -> list:
         """Determine which features triggered high anxiety"""
-        triggered = []
-        
-        # Thresholds from research
-        thresholds = {
-            'RED_METRIC': 2.5,
-            'TYPING_SPEED': 0.65,  # 35% drop from baseline
-            'BACKSPACE_RATE': 0.3,
-            'KEYSTROKE_RATE': 0.5
-        }
-        
-        if features.get('RED_METRIC', 0) > thresholds['RED_METRIC']:
-            triggered.append('Repeated Errors')
-        
-        if features.get('TYPING_SPEED', 1) < thresholds['TYPING_SPEED']:
-            triggered.append('Slow Typing')
-        
-        if features.get('BACKSPACE_RATE', 0) > thresholds['BACKSPACE_RATE']:
-            triggered.append('Excessive Corrections')
-        
-        if features.get('KEYSTROKE_RATE', 0) > thresholds['KEYSTROKE_RATE']:
-            triggered.append('Irregular Rhythm')
-        
-        if features.get('COMPILE_ERROR', 0) > 0.5:
-            triggered.append('Frequent Compilation Errors')
-        
-        if features.get('FOCUS_SWITCHES', 0) > 5:
-            triggered.append('Frequent Context Switching')
-        
-        return triggered if triggered else ['Normal Pattern']
+        values = np.fromiter((features.get(k, _FEATURE_DEFAULTS[i]) for i, k in enumerate(FEATURE_KEYS)),
+                             dtype=np.float64, count=len(FEATURE_KEYS))
+        return _triggered_labels(values)
     
     def should_intervene(self, anxiety_level: str, confidence: float) -> bool:
         """Determine if intervention should be triggered"""
+        now = time.monotonic()
+        
         # Check cooldown
-        if self.last_intervention:
-            cooldown_elapsed = (datetime.now() - self.last_intervention).total_seconds()
-            if cooldown_elapsed < self.intervention_cooldown:
-                return False
+        if self.last_intervention_mono is not None and now - self.last_intervention_mono < self.intervention_cooldown:
+            return False
         
         # Check anxiety level
-        if anxiety_level in ['High', 'Extreme'] and confidence > 0.7:
-            self.last_intervention = datetime.now()
+        if anxiety_level in _INTERVENTION_LEVELS and confidence > 0.7:
+            self.last_intervention_mono = now
             return True
         
         return False
     
     def get_error_hint(self, error_type: str) -> str:
         """Get helpful hint for error type"""
-        hints = {
-            'syntax_error': "Check for missing semicolons, brackets, or parentheses",
-            'missing_semicolon': "You might be missing a semicolon at the end of a statement",
-            'undefined_reference': "You might be missing a header file or library link",
-            'missing_header': "Check if you've included the necessary header files",
-            'segmentation_fault': "Check for null pointers or array bounds",
-            'null_pointer': "Make sure to initialize pointers before using them",
-            'array_bounds': "Ensure array indices are within bounds",
-            'uninitialized': "Initialize variables before using them",
-            'memory_leak': "Remember to free allocated memory",
-            'buffer_overflow': "Check array sizes and string lengths",
-            'type_mismatch': "Ensure types are compatible",
-            'no_matching_function': "Check function parameters and overloads",
-            'ambiguous': "Make the call more specific",
-            'redefinition': "Remove duplicate declarations",
-            'undeclared': "Declare variables before using them",
-            'incomplete_type': "Include the full type definition"
-        }
-        
-        for key, hint in hints.items():
-            if key in error_type.lower():
-                return hint
-        
-        return "Take a deep breath. Try breaking down the problem into smaller parts."
+        error_type = error_type.lower()
+        
+        # Canonical error tags match a key exactly
+        hint = _HINTS.get(error_type)
+        if hint is not None:
+            return hint
+        
+        return self._lookup_hint(error_type)
+    
+    def _match_hint(self, error_type: str) -> str:
+        """Find the highest-priority hint whose key occurs in error_type"""
+        if self._hint_automaton is not None:
+            best = min((value for _, value in self._hint_automaton.iter(error_type)), default=None)
+            if best is not None:
+                return best[1]
+        else:
+            for key, hint in _HINTS.items():
+                if key in error_type:
+                    return hint
+        
+        return _HINT_DEFAULT
 
 class PipeServer:
     """Named pipe server for communication with Code::Blocks"""
     
-    def __init__(self, pipe_name=r'\\.\pipe\AnxietyDetector'):
+    def __init__(self, pipe_name=r'\\.\pipe\AnxietyDetector', num_instances=8):
+        """
+        Initialize server
+        
+        Args:
+            pipe_name: Name of the pipe clients connect to
+            num_instances: Pipe instances listening at once (and client threads)
+        """
         self.pipe_name = pipe_name
+        self.num_instances = num_instances
         self.detector = None
         self.running = True
-        self.pipe = None
+        self.listeners = []
+        self._init_lock = threading.Lock()
+        
+        # Connected pipes being served; an instance only listens while a
+        # worker is free, so extra clients see the pipe as busy
+        self._clients = set()
+        self._clients_lock = threading.Lock()
+        self._slot_free = win32event.CreateEvent(None, False, False, None)
+        
+        # Requests in flight per detector, so a replaced detector is only
+        # closed once the requests already using it have finished
+        self._detector_cond = threading.Condition()
+        self._detector_users = {}
+        
+        # Create a simple security descriptor that allows all access
+        # This avoids the None parameter issue
+        self._sa = win32security.SECURITY_ATTRIBUTES()
+        self._sa.bInheritHandle = 1
+        self._pipe_access = win32pipe.PIPE_ACCESS_DUPLEX | win32file.FILE_FLAG_OVERLAPPED
+        self._pipe_mode = win32pipe.PIPE_TYPE_MESSAGE | win32pipe.PIPE_READMODE_MESSAGE | win32pipe.PIPE_WAIT
     
     def initialize_detector(self, model_dir):
         """Initialize the anxiety detector"""
         try:
-            self.detector = AnxietyDetector(model_dir)
+            with self._init_lock:
+                detector = AnxietyDetector(model_dir)
+                with self._detector_cond:
+                    old, self.detector = self.detector, detector
+            if old is not None:
+                self.retire_detector(old)
             return True
         except Exception as e:
-            print(f"Failed to initialize detector: {e}")
+            log.error("Failed to initialize detector: %s", e)
             return False
     
+    def acquire_detector(self):
+        """Get the current detector and mark it in use; pair with release_detector"""
+        with self._detector_cond:
+            detector = self.detector
+            if detector is not None:
+                self._detector_users[detector] = self._detector_users.get(detector, 0) + 1
+            return detector
+    
+    def release_detector(self, detector):
+        """Mark a request using detector as finished"""
+        with self._detector_cond:
+            users = self._detector_users[detector] - 1
+            if users:
+                self._detector_users[detector] = users
+            else:
+                del self._detector_users[detector]
+                self._detector_cond.notify_all()
+    
+    def retire_detector(self, detector):
+        """Close a detector that is no longer current once nothing is using it"""
+        with self._detector_cond:
+            while self._detector_users.get(detector):
+                self._detector_cond.wait()
+        detector.close()
+    
     def run(self):
         """Run the pipe server"""
-        print(f"Starting pipe server on {self.pipe_name}")
+        log.info("Starting pipe server on %s", self.pipe_name)
+        
+        executor = ThreadPoolExecutor(max_workers=self.num_instances,
+                                      thread_name_prefix='pipe-client')
+        try:
+            while self.running:
+                try:
+                    self.accept_clients(executor)
+                except KeyboardInterrupt:
+                    log.info("Shutting down...")
+                    self.running = False
+                except Exception as e:
+                    log.error("Server error: %s", e)
+                    self.close_listeners()
+                    time.sleep(1)
+        finally:
+            self.close_listeners()
+            self.disconnect_clients()
+            executor.shutdown(wait=False)
+    
+    def accept_clients(self, executor):
+        """Wait on all listening pipe instances and hand connected ones to the pool"""
+        log.debug("Waiting for client connection...")
+        while self.running:
+            # Only listen on as many instances as there are free workers
+            with self._clients_lock:
+                free = self.num_instances - len(self._clients)
+            while len(self.listeners) < free:
+                self.listeners.append(self.create_listener())
+            
+            events = [self._slot_free] + [overlapped.hEvent for _, overlapped, _ in self.listeners]
+            rc = win32event.WaitForMultipleObjects(events, False, 500)
+            if rc == win32event.WAIT_TIMEOUT:
+                continue
+            
+            index = rc - win32event.WAIT_OBJECT_0
+            if index == 0:
+                # A client finished; top the listeners back up
+                continue
+            pipe, overlapped, connected = self.listeners.pop(index - 1)
+            
+            if not connected:
+                try:
+                    win32file.GetOverlappedResult(pipe, overlapped, False)
+                except pywintypes.error as e:
+                    log.warning("Connect error: %s", e)
+                    win32file.CloseHandle(pipe)
+                    continue
+            
+            log.debug("Client connected")
+            with self._clients_lock:
+                self._clients.add(pipe)
+            executor.submit(self.serve_client, pipe)
+    
+    def create_listener(self):
+        """
+        Create a pipe instance and start an overlapped wait for a client
+        
+        Returns:
+            Tuple of (pipe, overlapped, connected); connected is True if a
+            client connected before the wait started, in which case the
+            overlapped operation never completes and must not be queried
+        """
+        # Create named pipe with proper security attributes
+        pipe = win32pipe.CreateNamedPipe(
+            self.pipe_name,
+            self._pipe_access,
+            self._pipe_mode,
+            win32pipe.PIPE_UNLIMITED_INSTANCES,
+            65536, 65536, 0,
+            self._sa  # Use security attributes object, not None
+        )
+        
+        overlapped = pywintypes.OVERLAPPED()
+        overlapped.hEvent = win32event.CreateEvent(None, True, False, None)
+        connected = win32pipe.ConnectNamedPipe(pipe, overlapped) == winerror.ERROR_PIPE_CONNECTED
+        if connected:
+            # Client connected before we started waiting
+            win32event.SetEvent(overlapped.hEvent)
+        
+        return pipe, overlapped, connected
+    
+    def close_listeners(self):
+        """Close pipe instances that are still waiting for a client"""
+        for pipe, _, _ in self.listeners:
+            try:
+                win32file.CloseHandle(pipe)
+            except:
+                pass
+        self.listeners = []
+    
+    def disconnect_clients(self):
+        """Abort pending I/O on connected pipes so their workers can exit"""
+        with self._clients_lock:
+            for pipe in self._clients:
+                try:
+                    if hasattr(win32file, 'CancelIoEx'):
+                        win32file.CancelIoEx(pipe, None)
+                    win32pipe.DisconnectNamedPipe(pipe)
+                except:
+                    pass
+    
+    def serve_client(self, pipe):
+        """Handle requests from one connected client until it disconnects"""
+        overlapped = pywintypes.OVERLAPPED()
+        overlapped.hEvent = win32event.CreateEvent(None, True, False, None)
         
         while self.running:
+            use_msgpack = False
             try:
-                # Create a simple security descriptor that allows all access
-                # This avoids the None parameter issue
-                security_attributes = win32security.SECURITY_ATTRIBUTES()
-                security_attributes.bInheritHandle = 1
-                
-                # Create named pipe with proper security attributes
-                self.pipe = win32pipe.CreateNamedPipe(
-                    self.pipe_name,
-                    win32pipe.PIPE_ACCESS_DUPLEX,
-                    win32pipe.PIPE_TYPE_MESSAGE | win32pipe.PIPE_READMODE_MESSAGE | win32pipe.PIPE_WAIT,
-                    win32pipe.PIPE_UNLIMITED_INSTANCES,
-                    65536, 65536, 0,
-                    security_attributes  # Use security attributes object, not None
-                )
+                # Read request
+                payload, use_msgpack = self.read_message(pipe, overlapped)
+                if payload is None:
+                    log.warning("Request over %d bytes dropped", _MAX_FRAME)
+                    error_response = {'status': 'error', 'message': 'Request too large'}
+                    self.write_message(pipe, overlapped, error_response, use_msgpack)
+                    continue
                 
-                if self.pipe == win32file.INVALID_HANDLE_VALUE:
-                    print("Failed to create named pipe")
-                    time.sleep(1)
+                try:
+                    request_data = self.decode_message(payload, use_msgpack)
+                except (ValueError, msgpack.UnpackException) as e:
+                    log.warning("Decode error: %s", e)
+                    # Send error response
+                    error_response = {'status': 'error',
+                                      'message': 'Invalid msgpack' if use_msgpack else 'Invalid JSON'}
+                    self.write_message(pipe, overlapped, error_response, use_msgpack)
                     continue
                 
-                print("Waiting for client connection...")
-                # Wait for client to connect
-                result = win32pipe.ConnectNamedPipe(self.pipe, None)
-                print(f"Client connected (result: {result})")
+                # Process request
+                response = self.handle_request(request_data)
                 
-                # Handle client requests
-                while self.running:
-                    try:
-                        # Read request
-                        hr, data = win32file.ReadFile(self.pipe, 65536)
-                        if hr != 0:
-                            print(f"Read error: {hr}")
-                            break
-                            
-                        # Handle data based on Python version
-                        if isinstance(data, bytes):
-                            json_str = data.decode('utf-8')
-                        else:
-                            json_str = data
-                            
-                        request_data = json.loads(json_str)
-                        
-                        # Process request
-                        response = self.handle_request(request_data)
-                        
-                        # Send response
-                        json_response = json.dumps(response, default=str)
-                        win32file.WriteFile(self.pipe, json_response.encode('utf-8'))
-                        
-                    except pywintypes.error as e:
-                        if e.winerror == 109:  # Broken pipe
-                            print("Client disconnected")
-                            break
-                        elif e.winerror == 232:  # Pipe is being closed
-                            print("Pipe closing")
-                            break
-                        else:
-                            print(f"Pipe error: {e}")
-                            break
-                    except json.JSONDecodeError as e:
-                        print(f"JSON decode error: {e}")
-                        # Send error response
-                        error_response = {'status': 'error', 'message': 'Invalid JSON'}
-                        try:
-                            win32file.WriteFile(self.pipe, json.dumps(error_response).encode('utf-8'))
-                        except:
-                            pass
-                    except Exception as e:
-                        print(f"Error processing request: {e}")
-                        try:
-                            error_response = {'status': 'error', 'message': str(e)}
-                            win32file.WriteFile(self.pipe, json.dumps(error_response).encode('utf-8'))
-                        except:
-                            pass
+                # Send response
+                self.write_message(pipe, overlapped, response, use_msgpack)
                 
-                # Disconnect pipe
+            except pywintypes.error as e:
+                if e.winerror == 109:  # Broken pipe
+                    log.debug("Client disconnected")
+                    break
+                elif e.winerror in (232, 233, 995):  # Pipe closing, disconnected or I/O aborted
+                    log.debug("Pipe closing")
+                    break
+                else:
+                    log.warning("Pipe error: %s", e)
+                    break
+            except Exception as e:
+                log.error("Error processing request: %s", e)
                 try:
-                    win32pipe.DisconnectNamedPipe(self.pipe)
-                    win32file.CloseHandle(self.pipe)
+                    error_response = {'status': 'error', 'message': str(e)}
+                    self.write_message(pipe, overlapped, error_response, use_msgpack)
                 except:
                     pass
-                self.pipe = None
-                
-            except KeyboardInterrupt:
-                print("\nShutting down...")
-                self.running = False
-                break
-            except Exception as e:
-                print(f"Server error: {e}")
-                if self.pipe:
-                    try:
-                        win32file.CloseHandle(self.pipe)
-                    except:
-                        pass
-                    self.pipe = None
-                time.sleep(1)
+        
+        # Disconnect pipe
+        with self._clients_lock:
+            self._clients.discard(pipe)
+            try:
+                win32pipe.DisconnectNamedPipe(pipe)
+                win32file.CloseHandle(pipe)
+            except:
+                pass
+        win32event.SetEvent(self._slot_free)
+    
+    def read_pipe(self, pipe, overlapped, size):
+        """
+        Overlapped ReadFile that waits for completion
+        
+        Returns:
+            Tuple of (hr, data); hr is ERROR_MORE_DATA if the message continues
+        """
+        buf = win32file.AllocateReadBuffer(size)
+        try:
+            win32file.ReadFile(pipe, buf, overlapped)
+            n = win32file.GetOverlappedResult(pipe, overlapped, True)
+        except pywintypes.error as e:
+            if e.winerror != ERROR_MORE_DATA:
+                raise
+            return ERROR_MORE_DATA, bytes(buf)
+        return 0, bytes(buf[:n])
+    
+    def read_message(self, pipe, overlapped):
+        """
+        Read one request from the pipe
+        
+        Returns:
+            Tuple of (payload, use_msgpack); payload is None if the request
+            was larger than _MAX_FRAME and has been discarded
+        """
+        hr, data = self.read_pipe(pipe, overlapped, 65536)
+        buf = bytearray(data)
+        
+        if buf.lstrip(_JSON_LEAD)[:1] == b'{':
+            # Legacy JSON client: one request per pipe message
+            while hr == ERROR_MORE_DATA:
+                hr, data = self.read_pipe(pipe, overlapped, 65536)
+                buf += data
+                if len(buf) > _MAX_FRAME:
+                    self.discard_message(pipe, overlapped, hr)
+                    return None, False
+            if buf.startswith(_UTF8_BOM):
+                del buf[:len(_UTF8_BOM)]
+            return buf, False
+        
+        # Length-prefixed msgpack frame
+        while len(buf) < _FRAME_HEADER.size:
+            hr, data = self.read_pipe(pipe, overlapped, _FRAME_HEADER.size - len(buf))
+            buf += data
+        (length,) = _FRAME_HEADER.unpack_from(buf)
+        if length > _MAX_FRAME:
+            # Not a frame we accept; drop the rest of this pipe message
+            self.discard_message(pipe, overlapped, hr)
+            return None, True
+        end = _FRAME_HEADER.size + length
+        while len(buf) < end:
+            hr, data = self.read_pipe(pipe, overlapped, end - len(buf))
+            buf += data
+        return memoryview(buf)[_FRAME_HEADER.size:end], True
+    
+    def discard_message(self, pipe, overlapped, hr):
+        """Read and drop the rest of the current pipe message"""
+        while hr == ERROR_MORE_DATA:
+            hr, _ = self.read_pipe(pipe, overlapped, 65536)
+    
+    def decode_message(self, payload, use_msgpack):
+        """Decode a request payload"""
+        if use_msgpack:
+            return msgpack.unpackb(payload, raw=False, timestamp=3,
+                                   ext_hook=_msgpack_ext_hook)
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload)
+    
+    def write_message(self, pipe, overlapped, response, use_msgpack):
+        """Encode and send a response using the request's wire format"""
+        if use_msgpack:
+            # msgpack writes the AnalyzeResult tuple as a plain array
+            buf = msgpack.packb(response, use_bin_type=True, datetime=True,
+                                default=_msgpack_default)
+            data = _FRAME_HEADER.pack(len(buf)) + buf
+        else:
+            # JSON clients (the C++ bridge) look prediction fields up by name
+            prediction = response.get('prediction')
+            if isinstance(prediction, AnalyzeResult):
+                response = dict(response, prediction=prediction._asdict())
+            
+            if orjson is not None:
+                data = orjson.dumps(response, option=_ORJSON_OPTIONS)
+            else:
+                data = json.dumps(response, default=str, separators=(',', ':')).encode('utf-8')
+        
+        win32file.WriteFile(pipe, data, overlapped)
+        win32file.GetOverlappedResult(pipe, overlapped, True)
     
     def handle_request(self, data):
         """Handle client requests"""
@@ -309,11 +789,16 @@ class PipeServer:
             }
         
         elif request_type == 'analyze':
-            if not self.detector:
+            detector = self.acquire_detector()
+            if detector is None:
                 return {'status': 'error', 'message': 'Detector not initialized'}
             
             session_data = data.get('session', {})
-            result = self.detector.analyze_session(session_data)
+            try:
+                result = detector.analyze_session(session_data, data.get('proto_version', 1),
+                                                  verbose=data.get('verbose', False))
+            finally:
+                self.release_detector(detector)
             
             return {
                 'status': 'ok',
@@ -321,11 +806,12 @@ class PipeServer:
             }
         
         elif request_type == 'get_hint':
-            if not self.detector:
+            detector = self.detector
+            if detector is None:
                 return {'status': 'error', 'message': 'Detector not initialized'}
             
             error_type = data.get('error_type', '')
-            hint = self.detector.get_error_hint(error_type)
+            hint = detector.get_error_hint(error_type)
             
             return {
                 'status': 'ok',
@@ -334,6 +820,10 @@ class PipeServer:
         
         elif request_type == 'shutdown':
             self.running = False
+            with self._detector_cond:
+                old, self.detector = self.detector, None
+            if old is not None:
+                self.retire_detector(old)
             return {'status': 'ok', 'message': 'Shutting down'}
         
         return {'status': 'error', 'message': f'Unknown request type: {request_type}'}
@@ -351,6 +841,7 @@ def main():
         print(f"Error: Model directory not found: {model_dir}")
         sys.exit(1)
     
+    listener = _start_logging()
     server = PipeServer()
     
     print("=" * 50)
@@ -367,11 +858,9 @@ def main():
         print("\nShutting down...")
     finally:
         server.running = False
-        if server.pipe:
-            try:
-                win32file.CloseHandle(server.pipe)
-            except:
-                pass
+        server.close_listeners()
+        server.disconnect_clients()
+        listener.stop()
         print("Service stopped")
 
 if __name__ == "__main__":
@@ -3,13 +3,164 @@ Feature Extractor Module for Anxiety Detection
 Extracts behavioral features from C/C++ programming sessions
 """
 
+import sys
+import functools
 import numpy as np
 from collections import deque
 import re
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Union
 import json
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; typing statistics use NumPy without it
+    njit = None
+
+# Feature names in the order expected by the model, interned so dict
+# lookups by these keys hit the identity fast path
+_FEATURE_NAMES = tuple(sys.intern(name) for name in (
+    'TYPING_SPEED',
+    'KEYSTROKE_RATE',
+    'BACKSPACE_RATE',
+    'COMPILE_ERROR',
+    'RED_METRIC',
+    'FOCUS_SWITCHES',
+    'IDLE_TO_ACTIVE_RATIO',
+    'UNDO_REDO_ATTEMPT'
+))
+
+# Error message normalization patterns, compiled once at import. Compiler
+# messages are nearly always ASCII, and for those the patterns run on bytes
+_NORM_PATTERNS = tuple((re.compile(pattern, re.ASCII), replacement) for pattern, replacement in (
+    (rb'line\s+\d+', b'line_num'),
+    (rb'column\s+\d+', b'col_num'),
+    (rb'[a-zA-Z]:\\(?:[^\\]+\\)*', b'path'),
+    (rb'0x[0-9a-f]+', b'memory_addr'),
+    (rb'\b\d+\b', b'number'),
+    (rb'\"[^\"]*\"', b'string_literal'),
+    (rb'\'[^\']*\'', b'char_literal')
+))
+
+# The normalization patterns fused into one alternation and substituted in a
+# single pass; each match is replaced by the token of the group that matched.
+# Applying them one after another lets each pattern see the output of the
+# earlier ones, while here all of them see the original message, so results
+# differ where matches interact: overlapping matches go to the leftmost rather
+# than the first listed (unbalanced quotes, a hex address running into
+# 'column'), \b looks at the original neighbours (digits right after a path,
+# 'C:\dir\5', become 'number' instead of staying as in 'path5'), and a token
+# no longer combines with the text around it into a new match
+_NORMALIZER = re.compile(b'|'.join(b'(%s)' % pattern.pattern for pattern, _ in _NORM_PATTERNS), re.ASCII)
+_NORM_TOKENS = (None,) + tuple(replacement for _, replacement in _NORM_PATTERNS)
+
+# C/C++ common error patterns for classification, in priority order
+_ERROR_PATTERNS = (
+    ('syntax_error', r'syntax error|expected|unexpected'),
+    ('missing_semicolon', r'expected.*;|missing.*;'),
+    ('undefined_reference', r'undefined reference|unresolved external'),
+    ('missing_header', r'cannot find|no such file|include'),
+    ('segmentation_fault', r'segmentation fault|access violation'),
+    ('null_pointer', r'null pointer|nullptr|NULL'),
+    ('array_bounds', r'array bounds|out of bounds|index.*out of range'),
+    ('uninitialized', r'uninitialized|used without being initialized'),
+    ('memory_leak', r'memory leak|leaked'),
+    ('buffer_overflow', r'buffer overflow|stack overflow'),
+    ('type_mismatch', r'type mismatch|cannot convert|incompatible type'),
+    ('no_matching_function', r'no matching function|overload.*not found'),
+    ('ambiguous', r'ambiguous|more than one instance'),
+    ('redefinition', r'redefinition|multiple definition'),
+    ('undeclared', r'not declared|undeclared'),
+    ('incomplete_type', r'incomplete type|forward declaration')
+)
+
+# Error patterns compiled once at import; the first one in priority order
+# that occurs anywhere in the message wins. Matched on the bytes of ASCII
+# messages, like the normalization patterns
+_ERROR_MATCHERS = tuple((name, re.compile(source.encode(), re.I | re.ASCII))
+                        for name, source in _ERROR_PATTERNS)
+
+# str copies of the patterns for messages that are not ASCII, where \b, \s,
+# \d and case folding keep their Unicode meaning; applied one after another
+_NORM_PATTERNS_STR = tuple((re.compile(pattern.pattern.decode()), replacement.decode())
+                           for pattern, replacement in _NORM_PATTERNS)
+_ERROR_MATCHERS_STR = tuple((name, re.compile(source, re.I)) for name, source in _ERROR_PATTERNS)
+
+# Error severity by type
+_ERROR_SEVERITY = {
+    'segmentation_fault': 1.0,
+    'memory_leak': 0.9,
+    'null_pointer': 0.8,
+    'buffer_overflow': 0.8,
+    'undefined_reference': 0.6,
+    'syntax_error': 0.5,
+    'type_mismatch': 0.4,
+    'undeclared': 0.3,
+    'warning': 0.1
+}
+
+def _norm_token(match) -> bytes:
+    return _NORM_TOKENS[match.lastindex]
+
+# Compilers repeat the same messages many times in a session, and the
+# description is a pure function of the message, so it is memoized
+@functools.lru_cache(maxsize=1024)
+def _describe_cached(error_msg: str) -> Tuple[str, str]:
+    """Normalized pattern and error category of a message"""
+    if error_msg.isascii():
+        raw = error_msg.encode('ascii')
+        normalized = _NORMALIZER.sub(_norm_token, raw).decode('ascii')
+        subject, matchers = raw, _ERROR_MATCHERS
+    else:
+        normalized = error_msg
+        for pattern, replacement in _NORM_PATTERNS_STR:
+            normalized = pattern.sub(replacement, normalized)
+        subject, matchers = error_msg.lower(), _ERROR_MATCHERS_STR
+    
+    category = 'unknown_error'
+    for name, pattern in matchers:
+        if pattern.search(subject):
+            category = name
+            break
+    
+    # Remove extra whitespace
+    return ' '.join(normalized.split()), category
+
+def _timestamps_ns(events: List[Dict]) -> np.ndarray:
+    """Event timestamps (datetime or ISO string) as int64 epoch nanoseconds"""
+    return np.asarray([ev['timestamp'] for ev in events], dtype='datetime64[ns]').view(np.int64)
+
+def _backspace_flags(keystrokes: List[Dict]) -> np.ndarray:
+    """is_backspace of each keystroke as a bool array"""
+    return np.fromiter((ks.get('is_backspace', False) for ks in keystrokes),
+                       dtype=bool, count=len(keystrokes))
+
+def _typing_stats_numpy(timestamps_ns):
+    """
+    Statistics of the keystroke intervals between 10 ms and 5 s
+    
+    Returns (count, mean, std, burst, pause_frequency) with times in
+    milliseconds; burst is the mean of the fastest 10% (the overall mean
+    for short runs) and pause_frequency the share of intervals over 2 s
+    """
+    all_intervals = np.diff(timestamps_ns) / 1e6
+    intervals = all_intervals[(all_intervals > 10) & (all_intervals < 5000)]
+    count = intervals.size
+    if count == 0:
+        return 0, 0.0, 0.0, 0.0, 0.0
+    
+    mean = float(intervals.mean())
+    k = count // 10
+    burst = float(np.partition(intervals, k)[:k].mean()) if k > 0 else mean
+    return count, mean, float(intervals.std()), burst, float((intervals > 2000).mean())
+
+try:
+    # Compiled ahead of time by _build_aot.py at install
+    from anxiety_kernels import typing_kernel as _typing_stats
+except ImportError:
+    from kernels import typing_kernel
+    _typing_stats = njit(cache=True)(typing_kernel) if njit is not None else _typing_stats_numpy
+
 class FeatureExtractor:
     """Extracts features from programming session data for anxiety detection"""
     
@@ -21,41 +172,15 @@ class FeatureExtractor:
             window_size: Size of rolling window for real-time features
         """
         self.window_size = window_size
-        self.rolling_keystrokes = deque(maxlen=window_size)
+        
+        # Rolling keystroke window as parallel arrays (ring buffer)
+        self._ks_ts = np.empty(window_size, dtype=np.int64)  # epoch nanoseconds
+        self._ks_bs = np.empty(window_size, dtype=bool)      # is_backspace
+        self._ks_head = 0
+        self._ks_count = 0
         self.rolling_compiles = deque(maxlen=window_size // 10)  # Store fewer compiles
         self.error_history = deque(maxlen=50)  # Store last 50 errors for RED metric
         
-        # Error pattern normalization patterns
-        self.normalization_patterns = [
-            (r'line\s+\d+', 'line_num'),
-            (r'column\s+\d+', 'col_num'),
-            (r'[a-zA-Z]:\\(?:[^\\]+\\)*', 'path'),
-            (r'0x[0-9a-f]+', 'memory_addr'),
-            (r'\b\d+\b', 'number'),
-            (r'\"[^\"]*\"', 'string_literal'),
-            (r'\'[^\']*\'', 'char_literal')
-        ]
-        
-        # C/C++ common error patterns for classification
-        self.error_patterns = {
-            'syntax_error': re.compile(r'syntax error|expected|unexpected', re.I),
-            'missing_semicolon': re.compile(r'expected.*;|missing.*;', re.I),
-            'undefined_reference': re.compile(r'undefined reference|unresolved external', re.I),
-            'missing_header': re.compile(r'cannot find|no such file|include', re.I),
-            'segmentation_fault': re.compile(r'segmentation fault|access violation', re.I),
-            'null_pointer': re.compile(r'null pointer|nullptr|NULL', re.I),
-            'array_bounds': re.compile(r'array bounds|out of bounds|index.*out of range', re.I),
-            'uninitialized': re.compile(r'uninitialized|used without being initialized', re.I),
-            'memory_leak': re.compile(r'memory leak|leaked', re.I),
-            'buffer_overflow': re.compile(r'buffer overflow|stack overflow', re.I),
-            'type_mismatch': re.compile(r'type mismatch|cannot convert|incompatible type', re.I),
-            'no_matching_function': re.compile(r'no matching function|overload.*not found', re.I),
-            'ambiguous': re.compile(r'ambiguous|more than one instance', re.I),
-            'redefinition': re.compile(r'redefinition|multiple definition', re.I),
-            'undeclared': re.compile(r'not declared|undeclared', re.I),
-            'incomplete_type': re.compile(r'incomplete type|forward declaration', re.I)
-        }
-        
         # Baseline stats
         self.baseline = {
             'typing_speed': 40.0,  # Default 40 WPM
@@ -75,15 +200,7 @@ class FeatureExtractor:
         Returns:
             Normalized error pattern
         """
-        normalized = error_msg
-        
-        for pattern, replacement in self.normalization_patterns:
-            normalized = re.sub(pattern, replacement, normalized)
-        
-        # Remove extra whitespace
-        normalized = ' '.join(normalized.split())
-        
-        return normalized
+        return _describe_cached(error_msg)[0]
     
     def classify_error(self, error_msg: str) -> str:
         """
@@ -95,20 +212,84 @@ class FeatureExtractor:
         Returns:
             Error category
         """
-        error_msg_lower = error_msg.lower()
+        return _describe_cached(error_msg)[1]
+    
+    def describe_error(self, error_msg: str) -> Tuple[str, str]:
+        """
+        Normalize and classify an error message together
         
-        for error_type, pattern in self.error_patterns.items():
-            if pattern.search(error_msg_lower):
-                return error_type
+        Args:
+            error_msg: Raw error message
+            
+        Returns:
+            Tuple of (normalized error pattern, error category)
+        """
+        return _describe_cached(error_msg)
+    
+    def push_keystroke(self, timestamp_ns: int, is_backspace: bool):
+        """
+        Append a keystroke to the rolling window, overwriting the oldest when full
         
-        return 'unknown_error'
+        Args:
+            timestamp_ns: Keystroke time as epoch nanoseconds
+            is_backspace: Whether the key was a backspace
+        """
+        head = self._ks_head
+        self._ks_ts[head] = timestamp_ns
+        self._ks_bs[head] = is_backspace
+        self._ks_head = (head + 1) % self.window_size
+        self._ks_count = min(self._ks_count + 1, self.window_size)
     
-    def extract_typing_features(self, keystrokes: List[Dict]) -> Dict[str, float]:
+    def extend_keystrokes(self, timestamps_ns: np.ndarray, is_backspace: np.ndarray):
+        """
+        Append keystrokes to the rolling window in bulk
+        
+        Args:
+            timestamps_ns: Keystroke times as epoch nanoseconds, oldest first
+            is_backspace: Backspace flags matching timestamps_ns
+        """
+        size = self.window_size
+        n = len(timestamps_ns)
+        if n > size:
+            # Only the newest window of keystrokes would survive
+            timestamps_ns, is_backspace = timestamps_ns[-size:], is_backspace[-size:]
+            n = size
+        
+        # Copy up to the end of the buffer, then wrap around to the start
+        head = self._ks_head
+        first = min(n, size - head)
+        np.copyto(self._ks_ts[head:head + first], timestamps_ns[:first])
+        np.copyto(self._ks_bs[head:head + first], is_backspace[:first])
+        np.copyto(self._ks_ts[:n - first], timestamps_ns[first:])
+        np.copyto(self._ks_bs[:n - first], is_backspace[first:])
+        
+        self._ks_head = (head + n) % size
+        self._ks_count = min(self._ks_count + n, size)
+    
+    def rolling_keystroke_window(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the rolling keystroke window, oldest first
+        
+        Returns:
+            Tuple of (epoch nanosecond timestamps, is_backspace flags)
+        """
+        if self._ks_count < self.window_size:
+            return self._ks_ts[:self._ks_count].copy(), self._ks_bs[:self._ks_count].copy()
+        
+        head = self._ks_head
+        return (np.concatenate((self._ks_ts[head:], self._ks_ts[:head])),
+                np.concatenate((self._ks_bs[head:], self._ks_bs[:head])))
+    
+    def extract_typing_features(self, keystrokes: List[Dict],
+                                timestamps_ns: Optional[np.ndarray] = None,
+                                is_backspace: Optional[np.ndarray] = None) -> Dict[str, float]:
         """
         Extract features related to typing behavior
         
         Args:
             keystrokes: List of keystroke events
+            timestamps_ns: Keystroke times as int64 epoch nanoseconds, if already known
+            is_backspace: Backspace flags of the keystrokes, if already known
             
         Returns:
             Dictionary of typing features
@@ -122,19 +303,14 @@ class FeatureExtractor:
                 'pause_frequency': 0.0
             }
         
-        # Convert timestamps to seconds
-        timestamps = [ks['timestamp'] for ks in keystrokes]
-        if isinstance(timestamps[0], str):
-            timestamps = [datetime.fromisoformat(ts) for ts in timestamps]
+        if timestamps_ns is None:
+            timestamps_ns = _timestamps_ns(keystrokes)
         
-        # Calculate intervals between keystrokes (in milliseconds)
-        intervals = []
-        for i in range(1, len(timestamps)):
-            interval = (timestamps[i] - timestamps[i-1]).total_seconds() * 1000
-            if 10 < interval < 5000:  # Ignore very short/long intervals
-                intervals.append(interval)
+        # Intervals between keystrokes (in milliseconds), ignoring very short/long ones
+        count, mean_interval, std_interval, burst_interval, pause_freq = _typing_stats(timestamps_ns)
+        total_time = (timestamps_ns[-1] - timestamps_ns[0]) / 1e9
         
-        if not intervals:
+        if count == 0:
             return {
                 'typing_speed': 1.0,
                 'keystroke_variance': 0.5,
@@ -144,7 +320,6 @@ class FeatureExtractor:
             }
         
         # Typing speed (characters per second)
-        total_time = (timestamps[-1] - timestamps[0]).total_seconds()
         if total_time > 0:
             chars_per_sec = len(keystrokes) / total_time
             wpm = chars_per_sec * 12  # Convert to WPM (assuming 5 chars/word)
@@ -152,23 +327,16 @@ class FeatureExtractor:
             wpm = 0
         
         # Keystroke variance (coefficient of variation)
-        mean_interval = float(np.mean(intervals))
-        std_interval = float(np.std(intervals))
         variance = std_interval / mean_interval if mean_interval > 0 else 0.5
         
         # Backspace rate
-        backspaces = sum(1 for ks in keystrokes if ks.get('is_backspace', False))
-        backspace_rate = backspaces / len(keystrokes) if keystrokes else 0
+        if is_backspace is None:
+            is_backspace = _backspace_flags(keystrokes)
+        backspaces = int(is_backspace.sum())
+        backspace_rate = backspaces / len(keystrokes)
         
         # Burst speed (fastest 10% of intervals)
-        sorted_intervals = sorted(intervals)
-        burst_threshold = int(len(sorted_intervals) * 0.1)
-        burst_intervals = sorted_intervals[:burst_threshold] if burst_threshold > 0 else [mean_interval]
-        burst_speed = 1000 / float(np.mean(burst_intervals)) if burst_intervals else 0  # chars per second
-        
-        # Pause frequency (intervals > 2 seconds)
-        pauses = sum(1 for i in intervals if i > 2000)
-        pause_freq = pauses / len(intervals) if intervals else 0
+        burst_speed = 1000 / burst_interval  # chars per second
         
         return {
             'typing_speed': float(wpm / self.baseline['typing_speed'] if self.baseline['typing_speed'] > 0 else 1.0),
@@ -197,51 +365,37 @@ class FeatureExtractor:
                 'repeated_error_ratio': 0.0
             }
         
+        # Single pass: failures, warnings, and normalized pattern + severity per error
+        failed = 0
+        total_warnings = 0
+        error_patterns = []
+        severities = []
+        for compile_event in compiles:
+            total_warnings += compile_event.get('warning_count', 0)
+            if not compile_event.get('success', True):
+                failed += 1
+                if 'error_message' in compile_event:
+                    normalized, error_type = self.describe_error(compile_event['error_message'])
+                    error_patterns.append(normalized)
+                    severities.append(_ERROR_SEVERITY.get(error_type, 0.5))
+        
         # Error rate
         total = len(compiles)
-        failed = sum(1 for c in compiles if not c.get('success', True))
         error_rate = failed / total if total > 0 else 0
         
         # Warning rate
-        total_warnings = sum(c.get('warning_count', 0) for c in compiles)
         warning_rate = total_warnings / total if total > 0 else 0
         
         # RED Metric (Repeated Error Density)
-        error_patterns = []
-        for compile_event in compiles:
-            if not compile_event.get('success', True) and 'error_message' in compile_event:
-                normalized = self.normalize_error_message(compile_event['error_message'])
-                error_patterns.append(normalized)
-        
-        # Calculate repeats
         if len(error_patterns) > 1:
-            repeats = 0
-            for i in range(1, len(error_patterns)):
-                if error_patterns[i] == error_patterns[i-1]:
-                    repeats += 1
+            # Compare consecutive patterns by hash as one int64 array op
+            hashes = np.fromiter(map(hash, error_patterns), dtype=np.int64, count=len(error_patterns))
+            repeats = int(np.count_nonzero(hashes[1:] == hashes[:-1]))
             red_metric = repeats / len(error_patterns) * 10  # Scale to 0-10
         else:
             red_metric = 0
         
         # Error severity (based on type)
-        severity_map = {
-            'segmentation_fault': 1.0,
-            'memory_leak': 0.9,
-            'null_pointer': 0.8,
-            'buffer_overflow': 0.8,
-            'undefined_reference': 0.6,
-            'syntax_error': 0.5,
-            'type_mismatch': 0.4,
-            'undeclared': 0.3,
-            'warning': 0.1
-        }
-        
-        severities = []
-        for compile_event in compiles:
-            if not compile_event.get('success', True) and 'error_message' in compile_event:
-                error_type = self.classify_error(compile_event['error_message'])
-                severities.append(severity_map.get(error_type, 0.5))
-        
         error_severity = float(np.mean(severities)) if severities else 0
         
         return {
@@ -252,12 +406,14 @@ class FeatureExtractor:
             'repeated_error_ratio': float(red_metric / 10.0)
         }
     
-    def extract_behavioral_features(self, session_data: Dict) -> Dict[str, float]:
+    def extract_behavioral_features(self, session_data: Dict,
+                                    timestamps_ns: Optional[np.ndarray] = None) -> Dict[str, float]:
         """
         Extract higher-level behavioral features
         
         Args:
             session_data: Complete session data
+            timestamps_ns: Keystroke times as int64 epoch nanoseconds, if already known
             
         Returns:
             Dictionary of behavioral features
@@ -274,26 +430,18 @@ class FeatureExtractor:
                 'recovery_time': 0.0
             }
         
-        # Convert timestamps
-        timestamps = [ks['timestamp'] for ks in keystrokes]
-        if isinstance(timestamps[0], str):
-            timestamps = [datetime.fromisoformat(ts) for ts in timestamps]
+        if timestamps_ns is None:
+            timestamps_ns = session_data.get('keystroke_timestamps_ns')
+            if timestamps_ns is None:
+                timestamps_ns = _timestamps_ns(keystrokes)
         
-        session_start = timestamps[0]
-        session_end = timestamps[-1]
-        duration = (session_end - session_start).total_seconds() / 60.0  # minutes
+        duration = (timestamps_ns[-1] - timestamps_ns[0]) / 1e9 / 60.0  # minutes
         
         # Focus switches (gaps > 30 seconds)
-        focus_switches = 0
-        idle_time = 0
-        last_time = timestamps[0]
-        
-        for ts in timestamps[1:]:
-            gap = (ts - last_time).total_seconds()
-            if gap > 30:
-                focus_switches += 1
-                idle_time += gap
-            last_time = ts
+        gaps = np.diff(timestamps_ns) / 1e9
+        idle_gaps = gaps[gaps > 30]
+        focus_switches = idle_gaps.size
+        idle_time = float(idle_gaps.sum())
         
         idle_ratio = idle_time / (duration * 60) if duration > 0 else 0
         
@@ -301,6 +449,7 @@ class FeatureExtractor:
         intensity = len(keystrokes) / duration if duration > 0 else 0
         
         # Recovery time after errors (time to next successful compile)
+        compile_times_ns = session_data.get('compile_timestamps_ns')
         recovery_times = []
         for i, compile_event in enumerate(compiles[:-1]):
             if not compile_event.get('success', True):
@@ -308,13 +457,10 @@ class FeatureExtractor:
                 for j in range(i + 1, len(compiles)):
                     if compiles[j].get('success', False):
                         # Time between error and success
-                        error_time = compile_event['timestamp']
-                        success_time = compiles[j]['timestamp']
-                        if isinstance(error_time, str):
-                            error_time = datetime.fromisoformat(error_time)
-                            success_time = datetime.fromisoformat(success_time)
+                        if compile_times_ns is None:
+                            compile_times_ns = _timestamps_ns(compiles)
+                        recovery = (compile_times_ns[j] - compile_times_ns[i]) / 1e9
                         
-                        recovery = (success_time - error_time).total_seconds()
                         if recovery < 300:  # Only count recoveries under 5 minutes
                             recovery_times.append(recovery)
                         break
@@ -329,59 +475,72 @@ class FeatureExtractor:
             'recovery_time': float(avg_recovery / 60.0)  # Convert to minutes
         }
     
-    def extract_all_features(self, session_data: Dict) -> Dict[str, float]:
+    def extract_all_features(self, session_data: Dict,
+                             out: Optional[np.ndarray] = None) -> Union[Dict[str, float], np.ndarray]:
         """
         Extract all features from session data
         
         Args:
             session_data: Complete session data from plugin
+            out: Optional array to write the features into, in get_feature_names() order
             
         Returns:
-            Dictionary of all features in format expected by model
+            Dictionary of all features in format expected by model, or out if given
         """
         keystrokes = session_data.get('keystrokes', [])
         compiles = session_data.get('compiles', [])
         
+        # Keystroke times and backspace flags are shared by the rolling window,
+        # typing and behavioral features
+        timestamps_ns = session_data.get('keystroke_timestamps_ns')
+        if timestamps_ns is None and keystrokes:
+            timestamps_ns = _timestamps_ns(keystrokes)
+        is_backspace = _backspace_flags(keystrokes)
+        
         # Update rolling windows
-        for ks in keystrokes[-self.window_size:]:
-            self.rolling_keystrokes.append(ks)
+        if keystrokes:
+            recent = min(len(keystrokes), self.window_size)
+            self.extend_keystrokes(timestamps_ns[-recent:], is_backspace[-recent:])
         
-        for comp in compiles[-10:]:  # Keep last 10 compiles
-            self.rolling_compiles.append(comp)
+        self.rolling_compiles.extend(compiles[-10:])  # Keep last 10 compiles
         
         # Extract different feature groups
-        typing_features = self.extract_typing_features(keystrokes)
+        typing_features = self.extract_typing_features(keystrokes, timestamps_ns, is_backspace)
         compile_features = self.extract_compile_features(compiles)
-        behavioral_features = self.extract_behavioral_features(session_data)
+        behavioral_features = self.extract_behavioral_features(session_data, timestamps_ns)
         
         # Combine into final feature set (order must match training data)
-        features = {
+        values = (
             # 1. Typing Speed (normalized)
-            'TYPING_SPEED': float(typing_features['typing_speed']),
+            typing_features['typing_speed'],
             
             # 2. Keystroke Rate (variance)
-            'KEYSTROKE_RATE': float(typing_features['keystroke_variance']),
+            typing_features['keystroke_variance'],
             
             # 3. Backspace Rate
-            'BACKSPACE_RATE': float(typing_features['backspace_rate']),
+            typing_features['backspace_rate'],
             
             # 4. Compile Error Rate
-            'COMPILE_ERROR': float(compile_features['compile_error_rate']),
+            compile_features['compile_error_rate'],
             
             # 5. RED Metric
-            'RED_METRIC': float(compile_features['red_metric']),
+            compile_features['red_metric'],
             
             # 6. Focus Switches
-            'FOCUS_SWITCHES': float(behavioral_features['focus_switches']),
+            behavioral_features['focus_switches'],
             
             # 7. Idle to Active Ratio
-            'IDLE_TO_ACTIVE_RATIO': float(behavioral_features['idle_ratio']),
+            behavioral_features['idle_ratio'],
             
             # 8. Undo/Redo Attempts (proxied by backspace bursts)
-            'UNDO_REDO_ATTEMPT': 1.0 if typing_features['backspace_rate'] > 0.4 else 0.0
-        }
+            1.0 if typing_features['backspace_rate'] > 0.4 else 0.0
+        )
+        
+        if out is not None:
+            out[:] = values
+            return out
         
-        return features
+        return dict(zip(_FEATURE_NAMES, values))
     
     def update_baseline(self, features: Dict[str, float], weight: float = 0.1):
         """
@@ -391,35 +550,44 @@ class FeatureExtractor:
             features: New feature values
             weight: Learning rate for baseline update
         """
+        self._blend_baseline(features.get('TYPING_SPEED', 1.0),
+                             features.get('BACKSPACE_RATE', 0.15),
+                             features.get('KEYSTROKE_RATE', 0.3),
+                             weight)
+    
+    def update_baseline_from_vector(self, vector: np.ndarray, weight: float = 0.1):
+        """
+        Update baseline statistics from a feature vector
+        
+        Args:
+            vector: Feature values in get_feature_names() order
+            weight: Learning rate for baseline update
+        """
+        # TYPING_SPEED, BACKSPACE_RATE, KEYSTROKE_RATE
+        self._blend_baseline(float(vector[0]), float(vector[2]), float(vector[1]), weight)
+    
+    def _blend_baseline(self, typing_speed: float, backspace_rate: float,
+                        keystroke_variance: float, weight: float):
         self.baseline['typing_speed'] = (1 - weight) * self.baseline['typing_speed'] + \
-                                        weight * features.get('TYPING_SPEED', 1.0) * 40
+                                        weight * typing_speed * 40
         self.baseline['backspace_rate'] = (1 - weight) * self.baseline['backspace_rate'] + \
-                                          weight * features.get('BACKSPACE_RATE', 0.15)
+                                          weight * backspace_rate
         self.baseline['keystroke_variance'] = (1 - weight) * self.baseline['keystroke_variance'] + \
-                                              weight * features.get('KEYSTROKE_RATE', 0.3)
+                                              weight * keystroke_variance
         self.baseline['samples'] += 1
     
     def get_feature_names(self) -> List[str]:
         """Get list of feature names in order expected by model"""
-        return [
-            'TYPING_SPEED',
-            'KEYSTROKE_RATE',
-            'BACKSPACE_RATE',
-            'COMPILE_ERROR',
-            'RED_METRIC',
-            'FOCUS_SWITCHES',
-            'IDLE_TO_ACTIVE_RATIO',
-            'UNDO_REDO_ATTEMPT'
-        ]
+        return list(_FEATURE_NAMES)
     
     def feature_vector_to_dict(self, vector: List[float]) -> Dict[str, float]:
         """Convert feature vector to dictionary"""
-        names = self.get_feature_names()
-        return {names[i]: float(vector[i]) for i in range(len(vector))}
+        return dict(zip(_FEATURE_NAMES, map(float, vector)))
     
     def dict_to_feature_vector(self, feature_dict: Dict[str, float]) -> List[float]:
         """Convert feature dictionary to vector in correct order"""
-        return [float(feature_dict.get(name, 0)) for name in self.get_feature_names()]
+        get = feature_dict.get
+        return [float(get(name, 0)) for name in _FEATURE_NAMES]
 
 # Helper function for JSON serialization
 def datetime_parser(dct):
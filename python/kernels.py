@@ -0,0 +1,45 @@
+"""
+Numeric Kernels for Anxiety Detection
+Plain Python loops that numba compiles, either just in time or ahead of
+time into the anxiety_kernels module by _build_aot.py
+"""
+
+import numpy as np
+
+def trigger_mask(f, t):
+    """Bitmask of the features in f that cross the thresholds in t"""
+    m = 0
+    if f[0] > t[0]: m |= 1
+    if f[1] < t[1]: m |= 2
+    if f[2] > t[2]: m |= 4
+    if f[3] > t[3]: m |= 8
+    if f[4] > t[4]: m |= 16
+    if f[5] > t[5]: m |= 32
+    return m
+
+def typing_kernel(timestamps_ns):
+    """Loop form of feature_extractor._typing_stats_numpy; keep the two in sync"""
+    n = timestamps_ns.shape[0] - 1
+    intervals = np.empty(max(n, 0))
+    count = 0
+    total = 0.0
+    pauses = 0
+    for i in range(n):
+        interval = (timestamps_ns[i + 1] - timestamps_ns[i]) / 1e6
+        if 10 < interval < 5000:
+            intervals[count] = interval
+            count += 1
+            total += interval
+            if interval > 2000:
+                pauses += 1
+    if count == 0:
+        return 0, 0.0, 0.0, 0.0, 0.0
+    
+    mean = total / count
+    sq = 0.0
+    for i in range(count):
+        d = intervals[i] - mean
+        sq += d * d
+    k = count // 10
+    burst = np.partition(intervals[:count], k)[:k].mean() if k > 0 else mean
+    return count, mean, np.sqrt(sq / count), burst, pauses / count
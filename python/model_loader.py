@@ -9,10 +9,27 @@ import joblib
 from typing import Dict, List, Tuple, Optional, Any
 import os
 import json
+import threading
 from datetime import datetime
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.svm import SVC
 
+def _load_pickled(path: str, mmap_mode: Optional[str] = None) -> Any:
+    """Load a joblib dump (memory-mapping its arrays if requested), falling back to plain pickle"""
+    try:
+        return joblib.load(path, mmap_mode=mmap_mode)
+    except Exception:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+def _read_json(path: str) -> Any:
+    """Parse a JSON file, or return None if it does not exist"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
 class ModelLoader:
     """Loads and manages the trained anxiety detection model"""
     
@@ -29,6 +46,19 @@ class ModelLoader:
         self.scaler = None
         self.feature_names = None
         self.model_metadata = {}
+        self.input_dtype = np.float64
+        
+        # Class names cached from the label encoder after loading
+        self._classes = None
+        self._n_classes = 0
+        
+        # StandardScaler parameters for scaling without sklearn's validation
+        self._sc_mean = None
+        self._sc_scale = None
+        
+        # Per-thread input row reused by predict_from_dict
+        self._n_features = 0
+        self._local = threading.local()
         
         # Anxiety level mapping
         self.anxiety_levels = ['Low', 'Moderate', 'High', 'Extreme']
@@ -47,11 +77,11 @@ class ModelLoader:
             True if successful, False otherwise
         """
         try:
-            # Load main model
+            # Load main model (arrays mapped copy-on-write: pages stay shared
+            # between processes, but libsvm still gets writable buffers)
             model_path = os.path.join(self.model_dir, 'best_anxiety_model.pkl')
             if os.path.exists(model_path):
-                with open(model_path, 'rb') as f:
-                    self.model = pickle.load(f)
+                self.model = _load_pickled(model_path, mmap_mode='c')
                 print(f"Loaded model from {model_path}")
             else:
                 print(f"Model file not found: {model_path}")
@@ -60,8 +90,7 @@ class ModelLoader:
             # Load label encoder
             encoder_path = os.path.join(self.model_dir, 'label_encoder.pkl')
             if os.path.exists(encoder_path):
-                with open(encoder_path, 'rb') as f:
-                    self.label_encoder = pickle.load(f)
+                self.label_encoder = _load_pickled(encoder_path)
                 print(f"Loaded label encoder from {encoder_path}")
             else:
                 print(f"Label encoder not found: {encoder_path}")
@@ -70,30 +99,47 @@ class ModelLoader:
             # Load scaler
             scaler_path = os.path.join(self.model_dir, 'scaler.pkl')
             if os.path.exists(scaler_path):
-                with open(scaler_path, 'rb') as f:
-                    self.scaler = pickle.load(f)
+                self.scaler = _load_pickled(scaler_path, mmap_mode='c')
                 print(f"Loaded scaler from {scaler_path}")
             else:
                 print(f"Scaler not found: {scaler_path}")
                 return False
             
-            # Try to load feature names if available
-            features_path = os.path.join(self.model_dir, 'feature_names.json')
-            if os.path.exists(features_path):
-                with open(features_path, 'r') as f:
-                    self.feature_names = json.load(f)
+            # Load model metadata, which carries the feature names when available
+            metadata = _read_json(os.path.join(self.model_dir, 'model_metadata.json'))
+            if isinstance(metadata, dict):
+                self.feature_names = metadata.get('feature_names')
+                self.model_metadata = metadata.get('metadata', metadata)
             
-            # Load model metadata
-            metadata_path = os.path.join(self.model_dir, 'model_metadata.json')
-            if os.path.exists(metadata_path):
-                with open(metadata_path, 'r') as f:
-                    self.model_metadata = json.load(f)
+            # Older model directories keep feature names in their own file
+            if self.feature_names is None:
+                self.feature_names = _read_json(os.path.join(self.model_dir, 'feature_names.json'))
             
             # Verify model compatibility
             if not self.verify_model():
                 print("Model verification failed")
                 return False
             
+            # Tree ensembles (sklearn, XGBoost, LightGBM) split on float32
+            # thresholds and cast their input to float32 anyway, so the scaled
+            # matrix is handed over in float32; kernel models such as SVC
+            # compute in float64
+            self.input_dtype = np.float32 if hasattr(self.model, 'feature_importances_') else np.float64
+            
+            # Decode labels by index instead of label_encoder.inverse_transform
+            self._classes = tuple(self.label_encoder.classes_.tolist())
+            self._n_classes = len(self._classes)
+            self._n_features = len(self.feature_names) if self.feature_names else len(self.scaler.mean_)
+            
+            # verify_model has checked the scaler, so apply a StandardScaler as
+            # (x - mean) / scale directly; other scalers go through transform
+            if isinstance(self.scaler, StandardScaler):
+                n = self.scaler.mean_.shape[0]
+                mean = self.scaler.mean_ if self.scaler.with_mean else np.zeros(n)
+                scale = self.scaler.scale_ if self.scaler.with_std else np.ones(n)
+                self._sc_mean = np.asarray(mean, dtype=np.float64)
+                self._sc_scale = np.asarray(scale, dtype=np.float64)
+            
             print("All models loaded successfully")
             return True
             
@@ -145,36 +191,79 @@ class ModelLoader:
         Returns:
             Tuple of (predicted_class, confidence, probabilities)
         """
+        predicted_classes, confidences, probabilities = self.predict_batch(features)
+        return predicted_classes[0], float(confidences[0]), probabilities[0]
+    
+    def predict_batch(self, features: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Make predictions for every row of a feature matrix in one model call
+        
+        Args:
+            features: Feature array (n_samples, n_features)
+            
+        Returns:
+            Tuple of (predicted_classes, confidences, probabilities)
+        """
         if self.model is None:
             raise ValueError("Model not loaded")
         
-        # Scale features
-        if self.scaler is not None:
+        features = np.asarray(features, dtype=np.float64)
+        
+        # Scale features in float64 like scaler.transform, then narrow the
+        # result, so tree models see exactly what sklearn would give them
+        if self._sc_scale is not None:
+            features_scaled = (features - self._sc_mean) / self._sc_scale
+        elif self.scaler is not None:
             features_scaled = self.scaler.transform(features)
         else:
             features_scaled = features
+        features_scaled = features_scaled.astype(self.input_dtype, copy=False)
         
-        # Predict class
-        prediction = self.model.predict(features_scaled)
-        
-        # Get probabilities
+        # Get probabilities, and take the most probable class from them
+        # rather than running the model's decision function a second time
         if hasattr(self.model, 'predict_proba'):
-            probabilities = self.model.predict_proba(features_scaled)[0]
+            probabilities = self.model.predict_proba(features_scaled)
+            prediction = self.model.classes_[probabilities.argmax(axis=1)]
         else:
             # Fallback for models without probability
-            probabilities = np.zeros(len(self.label_encoder.classes_)) if self.label_encoder else np.zeros(4)
-            probabilities[prediction[0]] = 1.0
+            prediction = self.model.predict(features_scaled)
+            n_classes = self._n_classes or 4
+            probabilities = np.zeros((len(prediction), n_classes))
+            probabilities[np.arange(len(prediction)), prediction] = 1.0
+        
+        # float32 is ample for probabilities and halves what callers carry
+        probabilities = probabilities.astype(np.float32, copy=False)
         
-        # Decode label
-        if self.label_encoder is not None:
-            predicted_class = self.label_encoder.inverse_transform(prediction)[0]
+        # Decode labels
+        if self._classes is not None:
+            classes = self._classes
+            predicted_classes = [classes[p] for p in prediction.tolist()]
         else:
-            predicted_class = str(prediction[0])
+            predicted_classes = [str(p) for p in prediction.tolist()]
         
         # Get confidence
-        confidence = float(np.max(probabilities))
+        confidences = probabilities.max(axis=1)
+        
+        return predicted_classes, confidences, probabilities
+    
+    def to_feature_array(self, feature_dict: Dict[str, float]) -> np.ndarray:
+        """Convert feature dictionary to a 1-D array in model order"""
+        if self.feature_names:
+            feature_vector = [feature_dict.get(name, 0) for name in self.feature_names]
+        else:
+            # Assume dict is in correct order
+            feature_vector = list(feature_dict.values())
         
-        return predicted_class, confidence, probabilities
+        return np.array(feature_vector, dtype=np.float64)
+    
+    def probabilities_to_dict(self, probabilities: np.ndarray) -> Dict[str, float]:
+        """Map a row of class probabilities to class names"""
+        if self._classes is not None:
+            class_names = self._classes
+        else:
+            class_names = [f"Class_{i}" for i in range(len(probabilities))]
+        
+        return dict(zip(class_names, probabilities.tolist()))
     
     def predict_from_dict(self, feature_dict: Dict[str, float]) -> Tuple[str, float, Dict[str, float]]:
         """
@@ -186,33 +275,50 @@ class ModelLoader:
         Returns:
             Tuple of (predicted_class, confidence, class_probabilities)
         """
-        # Convert dict to array in correct order
+        features = self._scratch_row()
         if self.feature_names:
-            feature_vector = [feature_dict.get(name, 0) for name in self.feature_names]
+            get = feature_dict.get
+            for i, name in enumerate(self.feature_names):
+                features[0, i] = get(name, 0)
         else:
             # Assume dict is in correct order
-            feature_vector = list(feature_dict.values())
-        
-        features = np.array(feature_vector, dtype=np.float64).reshape(1, -1)
+            features[0] = list(feature_dict.values())
         
         # Predict
         predicted_class, confidence, probabilities = self.predict(features)
         
-        # Create probability dict
-        if self.label_encoder is not None:
-            class_names = self.label_encoder.classes_
-        else:
-            class_names = [f"Class_{i}" for i in range(len(probabilities))]
+        return predicted_class, confidence, self.probabilities_to_dict(probabilities)
+    
+    def _scratch_row(self) -> np.ndarray:
+        """Preallocated (1, n_features) input row for the calling thread"""
+        row = getattr(self._local, 'scratch', None)
+        if row is None:
+            row = self._local.scratch = np.empty((1, self._n_features), dtype=np.float64)
+        return row
+    
+    def predict_from_dicts(self, feature_dicts: List[Dict[str, float]]) -> List[Tuple[str, float, Dict[str, float]]]:
+        """
+        Make predictions for several feature dictionaries in one model call
         
-        prob_dict = {str(class_names[i]): float(probabilities[i]) for i in range(len(probabilities))}
+        Args:
+            feature_dicts: Dictionaries of feature values
+            
+        Returns:
+            List of (predicted_class, confidence, class_probabilities) per dictionary
+        """
+        if not feature_dicts:
+            return []
         
-        return predicted_class, confidence, prob_dict
+        features = np.stack([self.to_feature_array(feature_dict) for feature_dict in feature_dicts])
+        predicted_classes, confidences, probabilities = self.predict_batch(features)
+        
+        return [(predicted_class, float(confidence), self.probabilities_to_dict(row))
+                for predicted_class, confidence, row in zip(predicted_classes, confidences, probabilities)]
     
     def get_anxiety_level(self, confidence: float, probabilities: np.ndarray) -> str:
         """Convert probability to anxiety level string"""
-        if self.label_encoder is not None:
-            class_idx = np.argmax(probabilities)
-            return self.label_encoder.inverse_transform([class_idx])[0]
+        if self._classes is not None:
+            return self._classes[int(np.argmax(probabilities))]
         else:
             # Fallback mapping
             if confidence < 0.3:
@@ -242,17 +348,17 @@ class ModelLoader:
             return None
         
         if self.feature_names and len(self.feature_names) == len(importances):
-            return {self.feature_names[i]: float(importances[i]) 
-                   for i in range(len(importances))}
+            names = self.feature_names
         else:
-            return {f"Feature_{i}": float(importances[i]) 
-                   for i in range(len(importances))}
+            names = [f"Feature_{i}" for i in range(len(importances))]
+        
+        return dict(zip(names, np.asarray(importances, dtype=np.float32).tolist()))
     
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the loaded model"""
         info = {
             'model_type': type(self.model).__name__ if self.model else 'None',
-            'classes': self.label_encoder.classes_.tolist() if self.label_encoder else [],
+            'classes': list(self._classes) if self._classes is not None else [],
             'n_features': self.scaler.n_features_in_ if self.scaler and hasattr(self.scaler, 'n_features_in_') else None,
             'metadata': self.model_metadata
         }
@@ -287,8 +393,9 @@ def save_feature_names(feature_names: List[str], save_path: str):
         json.dump(feature_names, f, indent=2)
 
 # Utility function to create model metadata
-def create_model_metadata(model, accuracy: float, precision: float, recall: float, f1_score: float):
-    """Create metadata file for model"""
+def create_model_metadata(model, accuracy: float, precision: float, recall: float, f1_score: float,
+                          feature_names: Optional[List[str]] = None):
+    """Create metadata file for model, optionally carrying the feature names"""
     metadata = {
         'accuracy': accuracy,
         'precision': precision,
@@ -297,4 +404,6 @@ def create_model_metadata(model, accuracy: float, precision: float, recall: floa
         'created': datetime.now().isoformat(),
         'model_type': type(model).__name__
     }
+    if feature_names is not None:
+        metadata['feature_names'] = list(feature_names)
     return metadata
\ No newline at end of file
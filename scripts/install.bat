@@ -121,10 +121,16 @@ python --version >nul 2>&1
 if %errorlevel% equ 0 (
     echo [OK] Python found
     echo Installing required Python packages...
-    pip install numpy pandas scikit-learn joblib pywin32
+    pip install numpy pandas scikit-learn joblib msgpack pywin32
+    
+    :: Precompile the numba kernels when numba is installed
+    python -c "import numba" >nul 2>&1
+    if !errorlevel! equ 0 (
+        python "%PYTHON_DIR%\_build_aot.py" && echo [OK] Numba kernels compiled
+    )
 ) else (
     echo [WARNING] Python not found in PATH. Please install Python 3.10+ and required packages:
-    echo pip install numpy pandas scikit-learn joblib pywin32
+    echo pip install numpy pandas scikit-learn joblib msgpack pywin32
 )
 
 :: Create uninstall script